@@ -1,28 +1,147 @@
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import base64
+import contextlib
+import json
 import logging
+import logging.handlers
+import os
+import queue
 import time
 import threading
-from typing import List, Optional, Dict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import List, Optional, Dict, Tuple
+
+try:
+    import orjson  # Optional: much faster decoding of large feed responses
+except ImportError:
+    orjson = None
 
 # Set up logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+
+@contextlib.contextmanager
+def _queued_logging():
+    """Hand log I/O to a listener thread for the duration of the block.
+
+    Only meant for the non-interactive polling/download phase: while it is active,
+    records are written asynchronously and could land after a following input() prompt.
+    """
+    root = logging.getLogger()
+    handlers = root.handlers[:]
+    log_queue = queue.Queue(-1)
+    listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    root.handlers = [logging.handlers.QueueHandler(log_queue)]
+    listener.start()
+    try:
+        yield
+    finally:
+        root.handlers = handlers
+        listener.stop()  # Writes out anything still queued
+
+
+def _json(response: requests.Response):
+    """Decode a JSON response body, using orjson when it is installed."""
+    if orjson is not None:
+        return orjson.loads(response.content)
+    return response.json()
+
+
+def _jwt_expiry(token: str) -> float:
+    """Return the `exp` claim of a JWT as a Unix timestamp, or 0 if it cannot be read."""
+    try:
+        payload = token.split('.')[1]
+        claims = json.loads(base64.urlsafe_b64decode(payload + '=' * (-len(payload) % 4)))
+        return float(claims['exp'])
+    except (AttributeError, IndexError, KeyError, TypeError, ValueError):
+        return 0.0
+
+
+def _write_all(fd: int, data: bytes, offset: Optional[int] = None):
+    """Write all of data to fd (at offset, if given), retrying after short writes."""
+    view = memoryview(data)
+    while view:
+        if offset is None:
+            written = os.write(fd, view)
+        else:
+            written = os.pwrite(fd, view, offset)
+            offset += written
+        view = view[written:]
+
+
 class Suno:
     CLERK_BASE_URL = "https://clerk.suno.com"
     BASE_URL = "https://studio-api.suno.ai"
     API_VERSION = "5.26.3"
+    FILENAME_TEMPLATE = "SunoMusic-{song_id}.mp3"
+    OTP_PROMPT = "🔑 Enter the OTP you received for {phone_number}: "
+    DOWNLOAD_PARTS = 4  # Parallel byte ranges per audio file
+    CHUNK_SIZE = 256 * 1024  # Bytes read per write when downloading audio
+    DEFAULT_HEADERS = {'Connection': 'keep-alive'}
+    RAW_AUDIO_HEADERS = {'Accept-Encoding': 'identity'}  # Byte offsets must refer to the raw file
+    TOKEN_RENEW_MARGIN = 30  # Seconds before expiry at which the session token is renewed
+    TIMEOUT = (5, 30)  # (connect, read) seconds for API calls
+    DOWNLOAD_TIMEOUT = (5, 60)  # Audio bodies can stall longer between reads
+
+    _adapter: Optional[HTTPAdapter] = None
+    _adapter_lock = threading.Lock()
 
     def __init__(self, phone_number: str):
         self.phone_number = phone_number.strip()
         self.client = requests.Session()  # Use session to persist connections
+        self.client.mount('https://', self._shared_adapter())
+        self.client.headers.update(self.DEFAULT_HEADERS)  # Inherited by every request on this session
         self.sid = None
         self.current_token = None
         self.authorization_token = None
-        self.sign_in()
+        self._sign_in_attempt_id = None
+        self._token_lock = threading.Lock()  # Serialize token renewals across download workers
+        self._token_expiry = 0.0
+        self._renewal_timer: Optional[threading.Timer] = None
+        self._closed = False
+        self._feed_url_tmpl = f"{self.BASE_URL}/api/feed/?ids={{ids}}"
+        self._token_url = None  # Resolved once the session ID is known
+
+    @classmethod
+    def _shared_adapter(cls) -> HTTPAdapter:
+        """Return the connection pool shared by every Suno instance.
+
+        Each instance keeps its own Session (and so its own Clerk cookies and
+        Authorization header), but they all reuse the same pooled TCP/TLS connections.
+        """
+        with cls._adapter_lock:
+            if cls._adapter is None:
+                cls._adapter = HTTPAdapter(
+                    pool_connections=32,
+                    pool_maxsize=32,
+                    max_retries=Retry(total=3, backoff_factor=0.5, status_forcelist=[502, 503, 504]),
+                )
+            return cls._adapter
 
     def sign_in(self):
         """Authenticate user by phone number and OTP."""
+        self.begin_sign_in()
+        self.complete_sign_in(self.prompt_otp())
+
+    def begin_sign_in(self):
+        """Start a sign-in attempt and have the OTP sent to the phone."""
+        self._sign_in_attempt_id = self.request_otp(self._send_sign_in())
+
+    def prompt_otp(self) -> str:
+        """Ask the user for the OTP sent to this phone number."""
+        return input(self.OTP_PROMPT.format(phone_number=self.phone_number))
+
+    def complete_sign_in(self, otp_code: str):
+        """Finish the sign-in started by begin_sign_in() with the received OTP."""
+        if not self._sign_in_attempt_id:
+            raise Exception("No sign-in attempt in progress. Call begin_sign_in() first.")
+        self.submit_otp(self._sign_in_attempt_id, otp_code)
+
+    def _send_sign_in(self) -> Dict:
+        """Start a sign-in attempt for the phone number and return it."""
         url = f"{self.CLERK_BASE_URL}/v1/client/sign_ins?_clerk_js_version={self.API_VERSION}"
         data = {"identifier": self.phone_number}
         response = self._post(url, data=data)
@@ -31,12 +150,11 @@ class Suno:
             sign_in_attempt = response.get('response')
             self.authorization_token = response.headers.get('Authorization')
             logger.info("Sign-in attempt successful.")
-            self.request_otp(sign_in_attempt)
-        else:
-            raise Exception(f"Sign-in failed for {self.phone_number}")
+            return sign_in_attempt
+        raise Exception(f"Sign-in failed for {self.phone_number}")
 
-    def request_otp(self, sign_in_attempt: Dict):
-        """Send OTP to the user's phone."""
+    def request_otp(self, sign_in_attempt: Dict) -> str:
+        """Send OTP to the user's phone and return the sign-in attempt ID."""
         phone_number_id = sign_in_attempt.get('supported_first_factors', [{}])[0].get('phone_number_id')
         sign_in_attempt_id = sign_in_attempt.get('id')
 
@@ -49,10 +167,8 @@ class Suno:
 
         if response:
             logger.info(f"OTP sent to {self.phone_number}.")
-            otp_code = input(f"🔑 Enter the OTP you received for {self.phone_number}: ")
-            self.submit_otp(sign_in_attempt_id, otp_code)
-        else:
-            raise Exception("Failed to send OTP")
+            return sign_in_attempt_id
+        raise Exception("Failed to send OTP")
 
     def submit_otp(self, sign_in_attempt_id: str, otp_code: str):
         """Verify the OTP and establish a session."""
@@ -64,6 +180,7 @@ class Suno:
             self.current_token = response['response'].get('last_active_session_id')
             self.sid = response['response'].get('created_session_id')
             if self.sid:
+                self._token_url = f"{self.CLERK_BASE_URL}/v1/client/sessions/{self.sid}/tokens?_clerk_js_version={self.API_VERSION}"
                 logger.info("Session established successfully.")
                 self._keep_alive()
             else:
@@ -88,21 +205,32 @@ class Suno:
             return song_ids
         return None
 
-    def check_song_status(self, song_ids: List[str]) -> bool:
-        """Check the readiness of the generated songs."""
-        url = f"{self.BASE_URL}/api/feed/?ids={','.join(song_ids)}"
-        response = self._get(url)
+    def feed_url(self, song_ids: List[str]) -> str:
+        """Build the feed URL for the given song IDs."""
+        return self._feed_url_tmpl.format(ids=','.join(song_ids))
+
+    def check_song_status(self, song_ids: List[str], url: Optional[str] = None) -> Optional[bool]:
+        """Check the readiness of the generated songs.
+
+        Pass a url built once with feed_url() to avoid rebuilding it on every poll.
+        Returns None if the status request itself failed, so callers can back off.
+        """
+        response = self._get(url or self.feed_url(song_ids))
 
+        if response is None:
+            return None
         if response:
             clips = response
-            for clip in clips:
-                logger.info(f"Song ID: {clip['id']}, Status: {clip['status']}")
+            logger.info("Statuses: %s", {clip['id']: clip['status'] for clip in clips})
+            if logger.isEnabledFor(logging.DEBUG):
+                for clip in clips:
+                    logger.debug("Song ID: %s, Status: %s", clip['id'], clip['status'])
             return all(clip['status'] in ['streaming', 'complete'] for clip in clips)
         return False
 
     def download_song(self, song_id: str) -> str:
-        """Download the song using its ID."""
-        url = f"{self.BASE_URL}/api/feed/?ids={song_id}"
+        """Download the song using its ID, skipping songs that are already on disk."""
+        url = self.feed_url([song_id])
         response = self._get(url)
 
         if response:
@@ -112,49 +240,170 @@ class Suno:
             raise Exception("No audio URL found.")
         raise Exception("Failed to retrieve song details.")
 
-    def _keep_alive(self):
-        """Renew the authentication token to keep the session active."""
-        if not self.sid:
+    def _keep_alive(self, force: bool = False):
+        """Renew the authentication token to keep the session active.
+
+        Does nothing while the current token is still valid, unless force is set.
+        """
+        if not self._token_url:
             raise Exception("Session ID is not set. Cannot renew token.")
 
-        url = f"{self.CLERK_BASE_URL}/v1/client/sessions/{self.sid}/tokens?_clerk_js_version={self.API_VERSION}"
-        response = self._post(url)
+        with self._token_lock:
+            if not force and time.time() < self._token_expiry - self.TOKEN_RENEW_MARGIN:
+                return
 
-        if response:
-            self.current_token = response.get('jwt')
-            self.client.headers.update({'Authorization': f"Bearer {self.current_token}"})
-            logger.info("Session token renewed.")
-        else:
-            raise Exception("Failed to renew session token.")
+            response = self._post(self._token_url)
+
+            if response:
+                self.current_token = response.get('jwt')
+                self._token_expiry = _jwt_expiry(self.current_token)
+                self.client.headers['Authorization'] = f"Bearer {self.current_token}"
+                logger.info("Session token renewed.")
+                self._schedule_renewal()
+            else:
+                raise Exception("Failed to renew session token.")
+
+    def close(self):
+        """Stop renewing the session token in the background."""
+        with self._token_lock:
+            self._closed = True
+            if self._renewal_timer:
+                self._renewal_timer.cancel()
+                self._renewal_timer = None
+
+    def _schedule_renewal(self):
+        """Renew the token in the background shortly before it expires."""
+        if self._renewal_timer:
+            self._renewal_timer.cancel()
+        if self._closed or not self._token_expiry:
+            return
+
+        delay = max(self._token_expiry - time.time() - self.TOKEN_RENEW_MARGIN, 1.0)
+        self._renewal_timer = threading.Timer(delay, self._renew_in_background)
+        self._renewal_timer.daemon = True
+        self._renewal_timer.start()
+
+    def _renew_in_background(self):
+        try:
+            self._keep_alive(force=True)
+        except Exception as e:
+            logger.error(f"Background token renewal failed for {self.phone_number}: {e}")
 
     def _download_audio(self, audio_url: str, song_id: str) -> str:
-        """Download the audio file."""
-        filename = f"SunoMusic-{song_id}.mp3"
-        with self.client.get(audio_url, stream=True) as r:
-            r.raise_for_status()
-            with open(filename, 'wb') as f:
-                for chunk in r.iter_content(chunk_size=8192):
-                    f.write(chunk)
+        """Download the audio file, in parallel byte ranges when the server allows it.
+
+        The file is written to a .part file and renamed into place only once complete.
+        """
+        filename = self.FILENAME_TEMPLATE.format(song_id=song_id)
+        size, accepts_ranges, etag = self._probe_audio(audio_url)
+        if self._is_downloaded(filename, size):
+            logger.info(f"Song already downloaded: {filename}")
+            return filename
+
+        tmp_filename = filename + '.part'
+        if (not size or not accepts_ranges or not hasattr(os, 'pwrite')
+                or not self._download_ranges(audio_url, tmp_filename, size, etag)):
+            self._download_stream(audio_url, tmp_filename)
+        os.replace(tmp_filename, filename)
         logger.info(f"Downloaded song: {filename}")
         return filename
 
+    @staticmethod
+    def _is_downloaded(filename: str, size: Optional[int]) -> bool:
+        """Check for a complete local copy, comparing sizes when the server reported one."""
+        if not os.path.exists(filename):
+            return False
+        local_size = os.path.getsize(filename)
+        return local_size == size if size else local_size > 0
+
+    def _probe_audio(self, url: str) -> Tuple[Optional[int], bool, Optional[str]]:
+        """Return the size of the audio file (None if unknown), whether it supports byte ranges, and its ETag."""
+        try:
+            response = self.client.head(url, headers=self.RAW_AUDIO_HEADERS, allow_redirects=True, timeout=self.TIMEOUT)
+            response.raise_for_status()
+        except requests.RequestException as e:
+            logger.warning(f"HEAD request failed: {e}")
+            return None, False, None
+
+        length = response.headers.get('Content-Length')
+        size = int(length) if length and length.isdigit() else None
+        return size, response.headers.get('Accept-Ranges') == 'bytes', response.headers.get('ETag')
+
+    def _download_ranges(self, audio_url: str, filename: str, size: int, etag: Optional[str] = None) -> bool:
+        """Fetch the file as parallel byte ranges. Returns False if any range did not come back intact."""
+        part_size = -(-size // self.DOWNLOAD_PARTS)
+        ranges = [(start, min(start + part_size, size) - 1) for start in range(0, size, part_size)]
+
+        fd = os.open(filename, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+        try:
+            os.ftruncate(fd, size)
+            with ThreadPoolExecutor(max_workers=len(ranges)) as executor:
+                futures = [executor.submit(self._download_range, audio_url, fd, start, end, size, etag)
+                           for start, end in ranges]
+                complete = all(future.result() for future in futures)
+            if complete:
+                os.fsync(fd)
+            return complete
+        finally:
+            os.close(fd)
+
+    def _download_range(self, audio_url: str, fd: int, start: int, end: int, size: int,
+                        etag: Optional[str] = None) -> bool:
+        """Write bytes start..end (inclusive) of the file at the matching offset.
+
+        Returns False unless the server sent exactly that range of a file of the expected size.
+        """
+        headers = {**self.RAW_AUDIO_HEADERS, 'Range': f'bytes={start}-{end}'}
+        if etag and not etag.startswith('W/'):
+            headers['If-Range'] = etag  # Never stitch together ranges of different file versions
+        with self.client.get(audio_url, headers=headers, stream=True, timeout=self.DOWNLOAD_TIMEOUT) as r:
+            r.raise_for_status()
+            if r.status_code != 206 or r.headers.get('Content-Range') != f'bytes {start}-{end}/{size}':
+                return False
+            offset = start
+            for chunk in r.iter_content(chunk_size=self.CHUNK_SIZE):
+                if offset + len(chunk) > end + 1:
+                    return False  # Would overwrite the neighbouring range
+                _write_all(fd, chunk, offset)
+                offset += len(chunk)
+        return offset == end + 1
+
+    def _download_stream(self, audio_url: str, filename: str):
+        """Download the file over a single sequential stream."""
+        with self.client.get(audio_url, stream=True, timeout=self.DOWNLOAD_TIMEOUT) as r:
+            r.raise_for_status()
+            r.raw.decode_content = True
+            # Write straight to the fd; chunks are already large, so Python's buffer only adds a copy
+            fd = os.open(filename, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+            try:
+                if hasattr(os, 'posix_fadvise'):
+                    os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_SEQUENTIAL)
+                while True:
+                    chunk = r.raw.read(self.CHUNK_SIZE)  # Read urllib3 directly, skipping the iter_content generator
+                    if not chunk:
+                        break
+                    _write_all(fd, chunk)
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+
     def _get(self, url: str) -> Optional[Dict]:
         """Perform a GET request and handle errors."""
         try:
-            response = self.client.get(url)
+            response = self.client.get(url, timeout=self.TIMEOUT)
             response.raise_for_status()
-            return response.json()
-        except requests.RequestException as e:
+            return _json(response)
+        except (requests.RequestException, ValueError) as e:
             logger.error(f"GET request failed: {e}")
             return None
 
     def _post(self, url: str, data=None, json=None) -> Optional[Dict]:
         """Perform a POST request and handle errors."""
         try:
-            response = self.client.post(url, data=data, json=json)
+            response = self.client.post(url, data=data, json=json, timeout=self.TIMEOUT)
             response.raise_for_status()
-            return response.json()
-        except requests.RequestException as e:
+            return _json(response)
+        except (requests.RequestException, ValueError) as e:
             logger.error(f"POST request failed: {e}")
             return None
 
@@ -162,14 +411,27 @@ class Suno:
 def main():
     print("Welcome to the Suno Music Generator!")
     phone_numbers = input("Enter phone numbers (comma-separated, including country code): ").split(",")
-    unique_numbers = set(phone.strip() for phone in phone_numbers)
+    unique_numbers = list(dict.fromkeys(phone.strip() for phone in phone_numbers))  # Dedupe, keep input order
+
+    # Request every OTP in parallel so they are all on their way before the first prompt.
+    candidates = [Suno(phone) for phone in unique_numbers]
+    pending = []
+    with ThreadPoolExecutor(max_workers=len(candidates)) as executor:
+        futures = [executor.submit(suno.begin_sign_in) for suno in candidates]
+        for suno, future in zip(candidates, futures):  # Prompt order follows the input order
+            try:
+                future.result()
+                pending.append(suno)
+            except Exception as e:
+                logger.error(f"Failed to initialize session for {suno.phone_number}: {e}")
 
     sessions = []
-    for phone in unique_numbers:
+    for suno in pending:
         try:
-            sessions.append(Suno(phone))
+            suno.complete_sign_in(suno.prompt_otp())
+            sessions.append(suno)
         except Exception as e:
-            logger.error(f"Failed to initialize session for {phone}: {e}")
+            logger.error(f"Failed to initialize session for {suno.phone_number}: {e}")
 
     if not sessions:
         logger.error("No valid sessions available.")
@@ -178,31 +440,58 @@ def main():
     prompt = input("Enter a creative prompt for the song: ")
 
     song_ids = None
+    owner = None  # The session that generated the songs; it alone can see and download them
     for session in sessions:
         try:
             logger.info(f"Generating song for {session.phone_number}...")
             song_ids = session.generate_song(prompt)
             if song_ids:
+                owner = session
                 break
         except Exception as e:
             logger.error(f"Error during song generation: {e}")
 
+    for session in sessions:
+        if session is not owner:
+            session.close()  # Only the owner is used from here on
+
     if not song_ids:
         logger.error("Failed to generate song with all sessions.")
         return
 
-    logger.info("Checking song readiness...")
-    while not all(session.check_song_status(song_ids) for session in sessions):
-        time.sleep(5)
-        logger.info("Still waiting for songs to be ready...")
-
-    logger.info("All songs are ready! Downloading...")
-    for session in sessions:
-        for song_id in song_ids:
+    try:
+        with _queued_logging():
+            logger.info("Checking song readiness...")
+            status_url = owner.feed_url(song_ids)
+            delay = 2.0
+            while True:
+                ready = owner.check_song_status(song_ids, status_url)
+                if ready:
+                    break
+
+                time.sleep(delay)
+                if ready is None:
+                    delay = min(delay * 2, 60.0)  # Back off harder while the API is failing
+                else:
+                    delay = min(delay * 1.5, 30.0)
+                logger.info("Still waiting for songs to be ready...")
+
+            logger.info("All songs are ready! Downloading...")
             try:
-                session.download_song(song_id)
+                owner._keep_alive()  # No request unless the token is about to expire
             except Exception as e:
-                logger.error(f"Failed to download song {song_id}: {e}")
+                logger.error(f"Failed to renew session for {owner.phone_number}: {e}")
+                return
+
+            with ThreadPoolExecutor(max_workers=min(8, len(song_ids))) as executor:
+                futures = {executor.submit(owner.download_song, song_id): song_id for song_id in song_ids}
+                for future in as_completed(futures):
+                    try:
+                        future.result()
+                    except Exception as e:
+                        logger.error(f"Failed to download song {futures[future]}: {e}")
+    finally:
+        owner.close()
 
 if __name__ == "__main__":
     main()